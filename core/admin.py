@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models.functions import Substr
 from .models import UserProfile, QueryHistory, LessonContent
 
 @admin.register(LessonContent)
@@ -8,10 +9,26 @@ class LessonContentAdmin(admin.ModelAdmin):
     list_filter = ('category', 'language')
     ordering = ('title',)
     readonly_fields = ()  # You can set fields here if you want to make any non-editable
+    list_per_page = 50
+    date_hierarchy = 'created_at'
+
+    def get_queryset(self, request):
+        # Truncate in SQL so the changelist never pulls full lesson bodies
+        return super().get_queryset(request).only(
+            'id', 'title', 'category', 'language', 'created_at'
+        ).annotate(_short_body=Substr('body', 1, 76))
 
     def short_body(self, obj):
-        return obj.body[:75] + '...' if len(obj.body) > 75 else obj.body
+        return obj._short_body[:75] + '...' if len(obj._short_body) > 75 else obj._short_body
     short_body.short_description = 'Body Preview'
-    
-admin.site.register(UserProfile)
-admin.site.register(QueryHistory)
+
+@admin.register(UserProfile)
+class UserProfileAdmin(admin.ModelAdmin):
+    list_display = ('user', 'phone', 'language', 'device_type')
+    list_select_related = ('user',)  # __str__ reads user.username
+
+@admin.register(QueryHistory)
+class QueryHistoryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'category', 'language', 'timestamp')
+    list_filter = ('category', 'language')
+    list_select_related = ('user',)
@@ -0,0 +1,68 @@
+"""
+Buffered QueryHistory writes: requests enqueue rows and a single background
+thread bulk-inserts them, so assistant responses never wait on an INSERT.
+Rows still queued when the process dies are lost, which is acceptable for history.
+"""
+import time
+import queue
+import logging
+import threading
+
+from django.db import close_old_connections
+
+from .models import QueryHistory
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+FLUSH_INTERVAL = 1.0
+
+_LOG_QUEUE = queue.Queue(maxsize=10000)
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _drain_forever():
+    while True:
+        # Block for the first row, then collect more until the batch or interval fills
+        batch = [_LOG_QUEUE.get()]
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while len(batch) < BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_LOG_QUEUE.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        close_old_connections()
+        try:
+            QueryHistory.objects.bulk_create(batch)
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} query history rows: {e}")
+
+
+def _ensure_writer():
+    # Started lazily so each gunicorn worker gets its own thread after fork
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_drain_forever, name="query-history-writer", daemon=True)
+            _writer.start()
+
+
+def log_query(user_id, query, response, category, language):
+    _ensure_writer()
+    try:
+        _LOG_QUEUE.put_nowait(QueryHistory(
+            user_id=user_id,
+            query=query,
+            response=response,
+            category=category,
+            language=language,
+        ))
+    except queue.Full:
+        logger.warning("Query history queue is full; dropping entry")
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.utils import CANNED_REPLIES, safe_tts
+
+LANGUAGES = ("en", "yo", "ig", "ha")
+
+
+class Command(BaseCommand):
+    help = "Synthesize the canned replies so their TTS audio URLs are cached before traffic arrives"
+
+    def handle(self, *args, **options):
+        if not settings.REDIS_URL:
+            self.stdout.write("REDIS_URL not set; a per-process cache can't be warmed. Skipping.")
+            return
+
+        for text in CANNED_REPLIES:
+            for language in LANGUAGES:
+                audio_url = safe_tts(text, language)
+                if audio_url:
+                    self.stdout.write(f"✅ [{language}] {text}")
+                else:
+                    self.stderr.write(f"❌ [{language}] TTS failed for: {text}")
@@ -0,0 +1,68 @@
+"""
+Prometheus metrics for the voice pipelines: per-stage latency, cache hit
+rates and which decoder handled the audio.
+
+Web processes expose them at /api/metrics to scrapers presenting METRICS_TOKEN
+as a bearer token; without the token set the endpoint does not exist. The Celery
+worker, where the WhatsApp pipeline runs, serves its own on CELERY_METRICS_PORT
+(see voicebridge/celery.py). With several gunicorn workers, set
+PROMETHEUS_MULTIPROC_DIR so /api/metrics aggregates all of them.
+"""
+import os
+import hmac
+
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+)
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# download, decode, gemini, tts, twilio_send
+STAGE_LATENCY = Histogram(
+    "voicebridge_stage_seconds",
+    "Latency of each voice pipeline stage",
+    ["stage"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32),
+)
+# cache: gemini, gemini_chat, tts, plus twiml_chat/twiml_tts for the webhook's
+# inline check (its misses are looked up again by the worker); result: hit, miss
+CACHE_LOOKUPS = Counter(
+    "voicebridge_cache_lookups_total",
+    "Gemini and TTS cache lookups",
+    ["cache", "result"],
+)
+# decoder: pyav, ffmpeg, or none when the input held no audio
+AUDIO_DECODES = Counter(
+    "voicebridge_audio_decodes_total",
+    "Audio normalisations by the decoder that produced them",
+    ["decoder"],
+)
+
+
+def record_cache_lookup(cache_name, value):
+    CACHE_LOOKUPS.labels(cache_name, "hit" if value else "miss").inc()
+    return value
+
+
+def metrics_view(request):
+    # Never served unauthenticated
+    if not METRICS_TOKEN:
+        return HttpResponse(status=404)
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    # Compared as bytes: compare_digest rejects non-ASCII str with a TypeError
+    if not hmac.compare_digest(supplied.encode(), METRICS_TOKEN.encode()):
+        return HttpResponse(status=401)
+
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -1,5 +1,7 @@
 from django.db import models
+from django.db.models.functions import Upper
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.utils import timezone
 
 class UserProfile(models.Model):
@@ -20,6 +22,9 @@ class QueryHistory(models.Model):
     language = models.CharField(max_length=20)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['user', '-timestamp'])]
+
     def __str__(self):
         return f"{self.user.username} - {self.category} @ {self.timestamp}"
 
@@ -31,5 +36,16 @@ class LessonContent(models.Model):
     body = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['language', 'category', '-created_at']),
+            models.Index(fields=['-created_at']),
+            # Trigram indexes on the same UPPER(...) expression icontains compiles to,
+            # so lesson search's '%q%' lookups are index scans
+            GinIndex(OpClass(Upper('title'), name='gin_trgm_ops'), name='lesson_title_trgm'),
+            GinIndex(OpClass(Upper('body'), name='gin_trgm_ops'), name='lesson_body_trgm'),
+        ]
+
     def __str__(self):
         return f"{self.title} ({self.language} - {self.category})"
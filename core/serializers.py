@@ -50,3 +50,9 @@ class LessonContentSerializer(serializers.ModelSerializer):
     class Meta:
         model = LessonContent
         fields = "__all__"
+
+
+class LessonContentListSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LessonContent
+        fields = ['id', 'title', 'category', 'language', 'created_at']
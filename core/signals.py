@@ -1,7 +1,14 @@
-from django.db.models.signals import post_save
+import time
+from django.db import connections
+from django.db.models.signals import post_save, post_delete, pre_migrate
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.dispatch import receiver
-from .models import UserProfile
+from .models import UserProfile, LessonContent
+
+# Bumped on every lesson save or delete; the lesson list ETag is built from it
+# (only when the cache is shared, see core/views.py)
+LESSONS_VERSION_KEY = "lessons:version"
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -13,3 +20,16 @@ def create_user_profile(sender, instance, created, **kwargs):
 def save_user_profile(sender, instance, **kwargs):
     if hasattr(instance, 'userprofile'):
         instance.userprofile.save()
+
+@receiver(pre_migrate)
+def enable_pg_trgm(sender, using, **kwargs):
+    # LessonContent's trigram indexes need the extension before core is migrated
+    if sender.name != 'core' or connections[using].vendor != 'postgresql':
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+@receiver(post_save, sender=LessonContent)
+@receiver(post_delete, sender=LessonContent)
+def bump_lessons_version(sender, **kwargs):
+    cache.set(LESSONS_VERSION_KEY, time.time_ns(), None)
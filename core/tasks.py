@@ -0,0 +1,104 @@
+import logging
+
+from celery import shared_task
+
+from .utils import (
+    MediaDownloadRetryableError,
+    MediaTooLargeError,
+    download_twilio_media,
+    normalize_audio,
+    safe_gemini_conversational_audio_or_text,
+    send_whatsapp_message,
+    send_whatsapp_reply,
+)
+
+logger = logging.getLogger(__name__)
+
+# Container hints for PyAV by Twilio media type; anything else is probed
+_WHATSAPP_AUDIO_FORMATS = {
+    "audio/ogg": "ogg",
+    "audio/mpeg": "mp3",
+    "audio/mp4": "mp4",
+    "audio/aac": "aac",
+    "audio/amr": "amr",
+}
+
+
+def _answer_whatsapp_audio(task, user_phone, audio_url, media_type):
+    """
+    Download, decode and run a WhatsApp voice note through Gemini.
+    Returns (ai_response, lang), or None once the user has been told what went wrong.
+    """
+    logger.debug("🎵 Processing WhatsApp audio from %s", audio_url)
+
+    # Download the audio file with Twilio authentication; only transient
+    # failures are retried, permanent ones come back as None
+    try:
+        audio_data = download_twilio_media(audio_url)
+    except MediaTooLargeError as e:
+        logger.warning(f"❌ {e}")
+        send_whatsapp_message(user_phone, "That voice note is too long for me. Please send audio under 10 minutes.")
+        return None
+    except MediaDownloadRetryableError as e:
+        if task.request.retries < task.max_retries:
+            raise task.retry(exc=e, countdown=2)
+        logger.error(f"❌ {e}")
+        audio_data = None
+    if not audio_data:
+        logger.error("❌ Failed to download audio with authentication")
+        send_whatsapp_message(user_phone, "Sorry, I couldn't access your audio message. Can you try again?")
+        return None
+
+    try:
+        input_format = _WHATSAPP_AUDIO_FORMATS.get((media_type or "").split(";")[0].strip())
+        processed_audio_data = normalize_audio(audio_data, input_format, output_format='flac')
+        if not processed_audio_data:
+            logger.error("❌ WhatsApp audio processing failed completely")
+            send_whatsapp_message(user_phone, "I couldn't process your audio format. Could you try sending a text message instead?")
+            return None
+
+        # Transient 503s are retried inside the call; anything else comes back as None
+        ai_response, lang = safe_gemini_conversational_audio_or_text(
+            audio_bytes=processed_audio_data,
+            input_format='flac',
+            normalized=True
+        )
+
+        if not ai_response:
+            logger.warning("Gemini returned empty response from WhatsApp audio.")
+            send_whatsapp_message(user_phone, "I couldn't understand anything in your audio message. Could you try speaking more clearly or send a text?")
+            return None
+
+    except Exception as e:
+        logger.error(f"❌ Complete WhatsApp audio processing failed: {str(e)}")
+        send_whatsapp_message(user_phone, "There was an unexpected error with your audio message. Please try a shorter message or use text.")
+        return None
+
+    return ai_response, lang
+
+
+@shared_task(bind=True, max_retries=3, acks_late=True, ignore_result=True)
+def process_whatsapp_message(self, user_phone, audio_url, body_text, media_type):
+    """
+    Answer one WhatsApp message (voice note or text) with audio + text.
+    Runs off the webhook so Twilio is acknowledged immediately.
+    """
+    if audio_url:
+        answer = _answer_whatsapp_audio(self, user_phone, audio_url, media_type)
+        if not answer:
+            return
+        ai_response, lang = answer
+
+    elif body_text:
+        ai_response, lang = safe_gemini_conversational_audio_or_text(text_input=body_text)
+        if not ai_response:
+            logger.warning("Gemini failed to generate response from WhatsApp text.")
+            send_whatsapp_message(user_phone, "Sorry, I couldn't understand your text message. Can you rephrase?")
+            return
+
+    else:
+        logger.warning("WhatsApp webhook received no audio or text input.")
+        send_whatsapp_message(user_phone, "I didn't receive any message. Please send an audio or text message.")
+        return
+
+    send_whatsapp_reply(user_phone, ai_response, lang)
@@ -9,9 +9,11 @@ from .views import (
     AssistantQueryView,
     VoiceUploadView,
     LessonContentView,
+    LessonContentDetailView,
     IVRHookView,
     WhatsAppWebhookView,
 )
+from .metrics import metrics_view
 
 urlpatterns = [
     path("", home, name='home'),
@@ -22,6 +24,8 @@ urlpatterns = [
     path("assistant/query", AssistantQueryView.as_view(), name="assistant-query"),
     path("assistant/voice-upload", VoiceUploadView.as_view(), name="voice-upload"),
     path("assistant/topic-lessons", LessonContentView.as_view(), name="lesson-content"),
+    path("assistant/topic-lessons/<int:pk>", LessonContentDetailView.as_view(), name="lesson-content-detail"),
     path("assistant/ivr-hook", csrf_exempt(IVRHookView.as_view()), name="ivr-hook"),
     path("assistant/whatsapp-hook", csrf_exempt(WhatsAppWebhookView.as_view()), name="whatsapp-webhook"),
+    path("metrics", metrics_view, name="metrics"),
 ]
\ No newline at end of file
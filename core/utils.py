@@ -1,18 +1,29 @@
 import os
 import io
-import uuid
+import re
 import time
+import wave
 import hashlib
+import functools
+from concurrent.futures import Future
 import mimetypes
+import tempfile
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import subprocess
-import tempfile
+import threading
 import logging
+import av
+import orjson
 from spitch import Spitch
-from pydub import AudioSegment
 from twilio.rest import Client
 import google.generativeai as genai
+from google.api_core import retry as api_retry
 from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable
+from django.core.cache import cache
+
+from .metrics import STAGE_LATENCY, AUDIO_DECODES, record_cache_lookup
 
 # Initialize logging for utils.py
 logger = logging.getLogger(__name__)
@@ -24,6 +35,93 @@ SPITCH_CLIENT = Spitch(api_key=SPITCH_API_KEY)
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_WHATSAPP_NUMBER = os.getenv("TWILIO_WHATSAPP_NUMBER")
+CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
+CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
+CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
+
+# Pooled keep-alive session for outbound HTTP (Cloudinary, Twilio media) and a
+# single Twilio client, so calls reuse connections instead of re-handshaking TLS
+HTTP = requests.Session()
+HTTP.mount("https://", HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(total=2, backoff_factor=0.2),
+))
+TWILIO_CLIENT = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN) if (TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN) else None
+
+# Twilio media/recording fetches: credentials set once, transient 5xx retried
+TWILIO_SESSION = requests.Session()
+TWILIO_SESSION.auth = (TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+TWILIO_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(total=2, backoff_factor=0.1, status_forcelist=[502, 503, 504]),
+))
+
+# Voices and prompt text are fixed per language, so build them once at import
+_VOICE_MAP = {"en": "lucy", "yo": "sade", "ig": "ngozi", "ha": "amina"}
+_LANG_NAME = {"yo": "yoruba", "ig": "igbo", "ha": "hausa"}
+
+_ASSISTANT_PERSONA = (
+    "You're a friendly multilingual Health, Education, Finance and Entertainment assistant named VoiceBridge who explains things clearly, simply, and respectfully. "
+    "Always answer like you're speaking directly to the person, not writing a formal essay. Don't try to format text in anyway(use of double asterisk before and after words to makde them bold, em dahses), just return plain text"
+)
+_LANGUAGE_INSTRUCTIONS = {
+    language: _ASSISTANT_PERSONA + f"You MUST reply in this language: {language}. Do not use markdown formatting."
+    for language in ("yoruba", "igbo", "hausa", "english")
+}
+_CONVERSATIONAL_INSTRUCTIONS = (
+    "Please analyze the provided input. First, identify the language used. "
+    "Then, respond naturally and conversationally to the content in the *exact same language* you detected. "
+    "Finally, append a language code at the very end of your response, formatted as 'Language Code: [code]'. "
+    "Use these specific codes: 'yo' for Yoruba, 'ig' for Igbo, 'ha' for Hausa, 'en' for English. "
+    "If the language is not Yoruba, Igbo, Hausa, or English, default the language code to 'en'. "
+    "Your conversational response should precede the language code. "
+    "You're a friendly multilingual Health, Education, Finance and Entertainment and AI assistant generally named VoiceBridge who explains things clearly, simply, and respectfully. "
+    "Always answer like you're speaking directly to the person, not writing a formal essay. Don't try to format text in anyway (use of double asterisk before and after words to make them bold, em dashes), just return plain text"
+)
+
+# Trailing "Language Code: xx" marker on conversational Gemini replies; the greedy
+# first group makes the last marker win
+_LANG_CODE_TAIL = re.compile(r"(.*)Language Code:\s*(.*?)\s*\Z", re.DOTALL | re.IGNORECASE)
+_SUPPORTED_LANG_CODES = frozenset({"yo", "ig", "ha", "en"})
+
+# WhatsApp voice notes above this are refused before download. Voice notes are
+# 16-24 kbps Opus, so this is roughly 11-16 minutes of speech (less for
+# higher-bitrate uploads such as MP3)
+MAX_WHATSAPP_AUDIO_BYTES = 2_000_000
+
+# A 503 from Gemini is usually momentary: retry it briefly in-call. 429s and
+# bad input are not retried
+GEMINI_REQUEST_OPTIONS = {
+    "retry": api_retry.Retry(
+        predicate=api_retry.if_exception_type(ServiceUnavailable),
+        initial=0.3,
+        maximum=2.0,
+        timeout=5.0,
+    )
+}
+
+# Repeat prompts (greetings, FAQs, canned fallbacks) are served from the cache
+GEMINI_CACHE_TTL = 60 * 60
+TTS_CACHE_TTL = 7 * 24 * 60 * 60
+
+# Long or personal prompts (numbers, emails, handles) practically never repeat;
+# caching them only fills Redis
+GEMINI_CACHEABLE_MAX_CHARS = 280
+_PERSONAL_TOKENS = re.compile(r"\d{4,}|@")
+
+# Fixed replies that get spoken back to users; warm_tts_cache pre-synthesizes them
+GEMINI_NOT_CONFIGURED_REPLY = "I'm sorry, Gemini is not configured."
+GEMINI_UNAVAILABLE_REPLY = "I'm sorry, Gemini is not available."
+GEMINI_OVERLOADED_REPLY = "I'm sorry, I'm a bit overwhelmed right now. Please try again in a moment."
+GEMINI_FAILED_REPLY = "I'm sorry, I couldn't understand your request."
+CANNED_REPLIES = (
+    GEMINI_NOT_CONFIGURED_REPLY,
+    GEMINI_UNAVAILABLE_REPLY,
+    GEMINI_OVERLOADED_REPLY,
+    GEMINI_FAILED_REPLY,
+)
 
 # Only import genai if GEMINI_API_KEY is available and we're not running in a very restricted environment
 # This helps avoid ImportError if the user doesn't need Gemini or hasn't installed its library.
@@ -36,220 +134,399 @@ except ImportError:
     logger.warning("google-generativeai library not installed. Gemini functions will not work.")
     genai = None # Set to None if import fails
 
-def upload_to_cloudinary(file_obj):
-    cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME")
-    api_key = os.getenv("CLOUDINARY_API_KEY")
-    api_secret = os.getenv("CLOUDINARY_API_SECRET")
+@functools.lru_cache(maxsize=16)
+def _gemini_model(model_name, system_instruction=None):
+    # Built once per (model, instruction) and reused; genai is configured at import
+    return genai.GenerativeModel(model_name=model_name, system_instruction=system_instruction)
 
-    if not (cloud_name and api_key and api_secret):
+@functools.lru_cache(maxsize=1)
+def _cloudinary_signature(timestamp):
+    # Uploads within the same second share one signature
+    params_to_sign = f"timestamp={timestamp}{CLOUDINARY_API_SECRET}"
+    return hashlib.sha1(params_to_sign.encode('utf-8')).hexdigest()
+
+def upload_to_cloudinary(file_obj):
+    if not (CLOUDINARY_CLOUD_NAME and CLOUDINARY_API_KEY and CLOUDINARY_API_SECRET):
         print("❌ Missing Cloudinary credentials.")
         return None
 
-    upload_url = f"https://api.cloudinary.com/v1_1/{cloud_name}/video/upload" # Use video for audio streaming
+    upload_url = f"https://api.cloudinary.com/v1_1/{CLOUDINARY_CLOUD_NAME}/video/upload" # Use video for audio streaming
 
     timestamp = int(time.time())
 
-    params_to_sign = f"timestamp={timestamp}{api_secret}"
-    signature = hashlib.sha1(params_to_sign.encode('utf-8')).hexdigest()
-
     data = {
-        "api_key": api_key,
+        "api_key": CLOUDINARY_API_KEY,
         "timestamp": timestamp,
-        "signature": signature
+        "signature": _cloudinary_signature(timestamp)
     }
 
+    opened = None
     if isinstance(file_obj, str):
         filename = os.path.basename(file_obj)
         content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
-        files = {"file": (filename, open(file_obj, "rb"), content_type)}
+        opened = open(file_obj, "rb")
+        files = {"file": (filename, opened, content_type)}
     else:
-        files = {"file": ("output.mp3", file_obj, "audio/mpeg")}
+        filename = getattr(file_obj, "name", None) or "output.mp3"
+        content_type = getattr(file_obj, "content_type", None) or "audio/mpeg"
+        files = {"file": (filename, file_obj, content_type)}
 
     try:
-        response = requests.post(upload_url, data=data, files=files)
+        response = HTTP.post(upload_url, data=data, files=files)
 
         if response.status_code == 200:
-            return response.json().get("secure_url")
+            return orjson.loads(response.content).get("secure_url")
         else:
             logger.error(f"Cloudinary upload error: {response.text}")
             return None
     except Exception as e:
         logger.error(f"Cloudinary upload exception: {e}")
         return None
+    finally:
+        if opened:
+            opened.close()
+
+_INFLIGHT = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+def _singleflight(key, fn, *args):
+    """
+    Run fn(*args) once per key at a time: concurrent callers with the same key
+    wait for the first caller's call and share its result (or exception)
+    """
+    with _INFLIGHT_LOCK:
+        future = _INFLIGHT.get(key)
+        leader = future is None
+        if leader:
+            future = _INFLIGHT[key] = Future()
+    if not leader:
+        return future.result()
+
+    try:
+        result = fn(*args)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _INFLIGHT_LOCK:
+            del _INFLIGHT[key]
+
+def _generate_text(model, contents):
+    with STAGE_LATENCY.labels("gemini").time():
+        return model.generate_content(contents, request_options=GEMINI_REQUEST_OPTIONS).text
+
+def _gemini_cache_key(kind, lang, text):
+    """
+    Cache key for a Gemini reply; case and spacing in the prompt don't change the answer
+    """
+    normalized = " ".join(text.split()).casefold()
+    return f"{kind}:" + hashlib.blake2b(f"{lang}|{normalized}".encode('utf-8'), digest_size=16).hexdigest()
 
-# def ask_gemini(prompt, lang):
-#     if not GEMINI_API_KEY:
-#         return "I'm sorry, Gemini is not configured. Please set GEMINI_API_KEY."
-#     if not genai:
-#         return "I'm sorry, the Google Generative AI library is not installed."
-
-#     url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent?key={GEMINI_API_KEY}"
-
-#     # Friendly assistant personality
-#     if lang == 'undefined':
-#         system_instruction = {
-#             "role": "user",
-#             "parts": [{
-#                 "text": (
-#                     f"You're a friendly multilingual Health, Education, Finance and Entertainment assistant named VoiceBridge who explains things clearly, simply, and respectfully. "
-#                     f"Always answer like you're speaking directly to the person, not writing a formal essay. Don't try to format text in anyway(use of double asterisk before and after words to makde them bold, em dahses), just return plain text"
-#                     f"Be short but descriptive, helpful, and human. You MUST detect the language used in {prompt} and reply in that language"
-#                 )
-#             }]
-#         }
-#     else:
-#         language = {
-#             "yo": "yoruba",
-#             "ig": "igbo",
-#             "ha": "hausa"
-#         }.get(lang, "english")
-
-#         system_instruction = {
-#             "role": "user",
-#             "parts": [{
-#                 "text": (
-#                     f"You're a friendly multilingual Health, Education, Finance and Entertainment assistant named VoiceBridge who explains things clearly, simply, and respectfully. "
-#                     f"Always answer like you're speaking directly to the person, not writing a formal essay. Don't try to format text in anyway(use of double asterisk before and after words to makde them bold, em dahses), just return plain text"
-#                     f"Be short but descriptive, helpful, and human. You MUST reply in this language: {language}."
-#                 )
-#             }]
-#         }
-
-#     user_message = {
-#         "role": "user",
-#         "parts": [{"text": prompt}]
-#     }
-
-#     body = {
-#         "contents": [system_instruction, user_message]
-#     }
-
-#     try:
-#         response = requests.post(url, json=body)
-#         response.raise_for_status()
-#         return response.json().get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
-#     except Exception as e:
-#         logger.error("Gemini API failed: %s", e)
-#         return "I'm sorry, I couldn't understand your request."
-
-# def ask_gemini(prompt, lang):
-#     if not GEMINI_API_KEY:
-#         return "I'm sorry, Gemini is not configured."
-
-#     # 2. Select the model (The library knows the correct URLs)
-#     # Use "gemini-1.5-flash" for stability or "gemini-2.0-flash-exp" for new features
-#     model = genai.GenerativeModel("gemini-1.5-flash") 
-
-#     # 3. Define the System Instruction (Persona)
-#     if lang == 'undefined':
-#         instruction = (
-#             "You're a friendly multilingual Health, Education, Finance and Entertainment assistant named VoiceBridge who explains things clearly, simply, and respectfully. "
-#             "Always answer like you're speaking directly to the person, not writing a formal essay. Don't try to format text in anyway(use of double asterisk before and after words to makde them bold, em dahses), just return plain text"
-#             f"You MUST detect the language used in '{prompt}' and reply in that language"
-#         )
-#     else:
-#         language = {"yo": "yoruba", "ig": "igbo", "ha": "hausa"}.get(lang, "english")
-#         instruction = (
-#             "You're a friendly multilingual Health, Education, Finance and Entertainment assistant named VoiceBridge who explains things clearly, simply, and respectfully. "
-#             "Always answer like you're speaking directly to the person, not writing a formal essay. Don't try to format text in anyway(use of double asterisk before and after words to makde them bold, em dahses), just return plain text"
-#             f"You MUST reply in this language: {language}."
-#         )
-
-#     try:
-#         # The library handles the system instruction logic cleanly here
-#         response = model.generate_content(
-#             contents=prompt,
-#             generation_config=genai.types.GenerationConfig(
-#                 system_instruction=instruction  # Note: Some versions require this passed differently, 
-#                                                 # but for simplicity, we can just prepend it to the prompt below
-#                                                 # if this specific param throws an error.
-#             )
-#         )
-#         return response.text
-
-#     except ResourceExhausted:
-#         return "I'm sorry, I'm a bit overwhelmed right now. Please try again in a moment."
-#     except Exception as e:
-#         print(f"Gemini Error: {e}")
-#         return "I'm sorry, I couldn't understand your request."
-    
 def ask_gemini(prompt, lang):
     if not GEMINI_API_KEY:
-        return "I'm sorry, Gemini is not configured."
+        return GEMINI_NOT_CONFIGURED_REPLY
 
-    # 1. Configure the library
-    genai.configure(api_key=GEMINI_API_KEY)
+    cache_key = _gemini_cache_key("gemini", lang, prompt)
+    cached_response = record_cache_lookup("gemini", cache.get(cache_key))
+    if cached_response:
+        return cached_response
 
-    # 2. Define the System Instruction (Persona) logic
+    # 1. Define the System Instruction (Persona) logic
     if lang == 'undefined':
         instruction = (
-            "You're a friendly multilingual Health, Education, Finance and Entertainment assistant named VoiceBridge who explains things clearly, simply, and respectfully. "
-            "Always answer like you're speaking directly to the person, not writing a formal essay. Don't try to format text in anyway(use of double asterisk before and after words to makde them bold, em dahses), just return plain text"
+            _ASSISTANT_PERSONA +
             f"You MUST detect the language used in '{prompt}' and reply in that language. "
             "Do not use markdown formatting."
         )
+        # This instruction embeds the prompt, so the model can't be reused
+        model = genai.GenerativeModel(model_name="gemini-1.5-flash", system_instruction=instruction)
     else:
-        language = {"yo": "yoruba", "ig": "igbo", "ha": "hausa"}.get(lang, "english")
-        instruction = (
-            "You're a friendly multilingual Health, Education, Finance and Entertainment assistant named VoiceBridge who explains things clearly, simply, and respectfully. "
-            "Always answer like you're speaking directly to the person, not writing a formal essay. Don't try to format text in anyway(use of double asterisk before and after words to makde them bold, em dahses), just return plain text"
-            f"You MUST reply in this language: {language}. "
-            "Do not use markdown formatting."
-        )
-
-    # 3. Initialize the Model WITH the system instruction
-    # Note: We pass system_instruction HERE, not in generate_content
-    model = genai.GenerativeModel(
-        model_name="gemini-1.5-flash",
-        system_instruction=instruction
-    )
+        instruction = _LANGUAGE_INSTRUCTIONS[_LANG_NAME.get(lang, "english")]
+        # Note: We pass system_instruction to the model, not in generate_content
+        model = _gemini_model("gemini-1.5-flash", instruction)
 
-    # 4. Generate Content
+    # 2. Generate Content
     try:
-        response = model.generate_content(prompt)
-        return response.text
+        # Identical prompts arriving together share one Gemini call
+        text = _singleflight(cache_key, _generate_text, model, prompt)
+        cache.set(cache_key, text, GEMINI_CACHE_TTL)
+        return text
 
     except ResourceExhausted:
-        return "I'm sorry, I'm a bit overwhelmed right now. Please try again in a moment."
+        return GEMINI_OVERLOADED_REPLY
     except Exception as e:
         print(f"Gemini Error: {e}")
-        return "I'm sorry, I couldn't understand your request."
+        return GEMINI_FAILED_REPLY
+
+# Wall-clock limit for one ffmpeg run; a wedged process must not pin a worker
+FFMPEG_TIMEOUT = 30
+
+def _ffmpeg_cmd(args):
+    # Short mono clips have nothing worth parallelising: one decode and one encode
+    # thread per process avoids spawn overhead and contention across concurrent
+    # jobs. Quiet logging keeps stderr short; bitexact drops the encoder tag from
+    # the output
+    return [
+        'ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'error',
+        '-threads', '1', '-i', 'pipe:0',
+        '-threads', '1', '-flags', '+bitexact', *args, 'pipe:1',
+    ]
+
+def _ffmpeg_pipe(in_bytes, args):
+    """
+    Transcode in_bytes with a single ffmpeg process over stdin/stdout
+    """
+    cmd = _ffmpeg_cmd(args)
+    return subprocess.run(cmd, input=in_bytes, capture_output=True, check=True, timeout=FFMPEG_TIMEOUT).stdout
+
+def _ffmpeg_stream(chunks, args):
+    """
+    Like _ffmpeg_pipe, but feeds ffmpeg from an iterable of byte chunks so
+    transcoding overlaps with the download producing them
+    """
+    cmd = _ffmpeg_cmd(args)
+    feed_error = []
+    timed_out = threading.Event()
+
+    # stderr goes to a file so a burst of per-frame errors can never fill a pipe
+    # nobody is reading and stall ffmpeg
+    with tempfile.TemporaryFile() as err_file, \
+            subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=err_file) as proc:
+        def feed():
+            try:
+                for chunk in chunks:
+                    proc.stdin.write(chunk)
+            except BrokenPipeError:
+                pass  # ffmpeg exited early; its return code says why
+            except Exception as e:
+                feed_error.append(e)
+            finally:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+
+        def kill():
+            timed_out.set()
+            proc.kill()
+
+        deadline = time.monotonic() + FFMPEG_TIMEOUT
+        # Killing ffmpeg closes its stdout, which ends the read below
+        watchdog = threading.Timer(FFMPEG_TIMEOUT, kill)
+        feeder = threading.Thread(target=feed, daemon=True)
+        watchdog.start()
+        feeder.start()
+        try:
+            out = proc.stdout.read()
+            proc.wait()
+        finally:
+            watchdog.cancel()
+        # The feeder may still be blocked on a stalled source; don't wait past the deadline
+        feeder.join(max(0, deadline - time.monotonic()))
+
+        err_file.seek(0)
+        err = err_file.read()
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, FFMPEG_TIMEOUT, output=out, stderr=err)
+    if feed_error:
+        raise feed_error[0]
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output=out, stderr=err)
+    return out
+
+def _pcm_to_wav(pcm, rate=16000):
+    # ffmpeg can't seek back to fill in WAV sizes on a pipe, so wrap raw PCM here
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm)
+    return out.getvalue()
+
+# Containers audio can be normalised into: WAV for Spitch STT, FLAC (lossless,
+# about half the bytes) for Gemini. WAV leaves ffmpeg as raw PCM and is wrapped
+# by _pcm_to_wav, since a pipe can't be seeked back to fill in the WAV sizes
+_AUDIO_ENCODERS = {"wav": "pcm_s16le", "flac": "flac"}
+_AUDIO_ENCODER_OPTIONS = {"flac": {"compression_level": "0"}}  # fastest; size barely differs
+_FFMPEG_OUTPUT_ARGS = {
+    "wav": ['-ac', '1', '-ar', '16000', '-f', 's16le'],
+    "flac": ['-ac', '1', '-ar', '16000', '-compression_level', '0', '-f', 'flac'],
+}
+_AUDIO_MIME_TYPES = {"wav": "audio/wav", "flac": "audio/flac"}
+
+def _from_ffmpeg(data, output_format):
+    return _pcm_to_wav(data) if output_format == "wav" else data
+
+class _BufferReader(io.RawIOBase):
+    """
+    Seekable read-only file over any bytes-like object. Unlike io.BytesIO, it
+    never copies a bytearray or memoryview
+    """
+    def __init__(self, data):
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        chunk = self._view[self._pos:self._pos + len(b)]
+        b[:len(chunk)] = chunk
+        self._pos += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+def decode_audio(audio_bytes, input_format=None, output_format="wav"):
+    """
+    Decode audio to 16 kHz mono 16-bit WAV or FLAC in-process with PyAV (libav),
+    avoiding an ffmpeg fork/exec and any temp files
+    """
+    out = io.BytesIO()
+
+    with av.open(_BufferReader(audio_bytes), format=input_format) as src, \
+            av.open(out, mode='w', format=output_format) as dst:
+        # A file with no audio track (e.g. a video-only clip) has nothing to decode
+        if not src.streams.audio:
+            return None
+
+        stream = dst.add_stream(
+            _AUDIO_ENCODERS[output_format], rate=16000, options=_AUDIO_ENCODER_OPTIONS.get(output_format)
+        )
+        stream.codec_context.layout = 'mono'
+        # FLAC only accepts fixed-size frames, so open the encoder to learn its frame
+        # size and let the resampler re-chunk to it; PCM reports 0 and takes any size
+        stream.codec_context.open()
+        resampler = av.AudioResampler(
+            format='s16', layout='mono', rate=16000,
+            frame_size=stream.codec_context.frame_size or None,
+        )
+
+        decoded_any = False
+        for frame in src.decode(audio=0):
+            decoded_any = True
+            frame.pts = None
+            for resampled in resampler.resample(frame):
+                dst.mux(stream.encode(resampled))
+        if not decoded_any:
+            return None
+
+        # Flush the resampler and encoder
+        for resampled in resampler.resample(None):
+            dst.mux(stream.encode(resampled))
+        dst.mux(stream.encode(None))
+
+    return out.getvalue()
+
+def normalize_audio(audio_bytes, input_format, output_format="wav"):
+    """
+    Convert audio to 16 kHz mono WAV (or FLAC) in-process with PyAV, falling back
+    to an ffmpeg subprocess only for input libav itself can't handle
+    """
+    # One observation per normalisation, whichever decoder ends up producing it
+    with STAGE_LATENCY.labels("decode").time():
+        return _normalize_audio(audio_bytes, input_format, output_format)
 
-def normalize_audio(audio_bytes, input_format):
+def _normalize_audio(audio_bytes, input_format, output_format):
     try:
-        audio = AudioSegment.from_file(io.BytesIO(audio_bytes), format=input_format)
-        audio = audio.set_channels(1).set_frame_rate(16000)
-        out = io.BytesIO()
-        audio.export(out, format="wav")
-        return out.getvalue()
+        audio_data = decode_audio(audio_bytes, input_format, output_format)
+        if not audio_data:
+            AUDIO_DECODES.labels("none").inc()
+            logger.warning("PyAV decoded no audio from %s input", input_format)
+            return None
+        AUDIO_DECODES.labels("pyav").inc()
+        return audio_data
+    except av.FFmpegError as e:
+        logger.warning("PyAV could not decode %s audio, falling back to ffmpeg: %s", input_format, e)
     except Exception as e:
-        logger.error("Failed to convert %s to wav: %s", input_format, e)
-        return None
+        # Resampler/encoder misuse surfaces as ValueError and friends, not FFmpegError;
+        # keep the return-None-on-failure contract and let ffmpeg have a go
+        logger.error("PyAV failed on %s audio, falling back to ffmpeg: %s", input_format, e)
 
-def safe_tts(text, language, prefix):
     try:
-        voice_map = {
-            "en": "lucy",
-            "yo": "sade",
-            "ig": "ngozi",
-            "ha": "amina"
-        }
-        voice_id = voice_map.get(language, "lucy")
-
-        response = SPITCH_CLIENT.speech.generate( # Use the global SPITCH_CLIENT
+        data = _ffmpeg_pipe(audio_bytes, _FFMPEG_OUTPUT_ARGS[output_format])
+        if not data:
+            AUDIO_DECODES.labels("none").inc()
+            return None
+        AUDIO_DECODES.labels("ffmpeg").inc()
+        return _from_ffmpeg(data, output_format)
+    except subprocess.CalledProcessError as e:
+        logger.error("Failed to convert %s to %s: %s", input_format, output_format, e.stderr.decode(errors='replace'))
+        return None
+    except subprocess.TimeoutExpired:
+        logger.error("Converting %s to %s timed out after %ss", input_format, output_format, FFMPEG_TIMEOUT)
+        return None
+    except Exception as e:
+        logger.error("Failed to convert %s to %s: %s", input_format, output_format, e)
+        return None
+
+def fetch_twilio_audio(url, output_format="wav"):
+    """
+    Stream a Twilio recording straight through ffmpeg into 16 kHz mono WAV or
+    FLAC, without holding the downloaded file in memory first
+    """
+    with TWILIO_SESSION.get(url, timeout=30, stream=True) as response:
+        response.raise_for_status()
+        data = _ffmpeg_stream(response.iter_content(64 * 1024), _FFMPEG_OUTPUT_ARGS[output_format])
+    if not data:
+        return None
+    return _from_ffmpeg(data, output_format)
+
+def _tts_cache_key(text, language):
+    # The audio depends on language, voice and text only, so every channel shares entries.
+    # Whitespace doesn't change the speech, but case can (acronyms), so it is kept
+    voice_id = _VOICE_MAP.get(language, "lucy")
+    normalized = " ".join(text.split())
+    return "tts:" + hashlib.blake2b(f"{language}|{voice_id}|{normalized}".encode('utf-8'), digest_size=16).hexdigest()
+
+def cached_tts_url(text, language, metric="tts"):
+    """
+    Cloudinary URL of already-synthesised audio for this text, or None
+    """
+    return record_cache_lookup(metric, cache.get(_tts_cache_key(text, language)))
+
+def _synthesize_and_upload(text, language, voice_id):
+    with STAGE_LATENCY.labels("tts").time():
+        # Transcode to MP3 while Spitch is still streaming the WAV down
+        with SPITCH_CLIENT.speech.with_streaming_response.generate( # Use the global SPITCH_CLIENT
             text=text,
             language=language,
             voice=voice_id
-        )
+        ) as response:
+            mp3 = _ffmpeg_stream(response.iter_bytes(), ['-codec:a', 'libmp3lame', '-b:a', '48k', '-f', 'mp3'])
 
-        wav_path = f"/tmp/{prefix}_{uuid.uuid4().hex}.wav"
-        with open(wav_path, "wb") as f:
-            f.write(response.read())
+        return upload_to_cloudinary(io.BytesIO(mp3))
 
-        mp3_path = wav_path.replace(".wav", ".mp3")
-        AudioSegment.from_wav(wav_path).export(mp3_path, format="mp3")
+def safe_tts(text, language):
+    return cached_tts_url(text, language) or render_tts(text, language)
 
-        return upload_to_cloudinary(mp3_path)
+def render_tts(text, language):
+    """
+    Synthesise and upload audio for text the caller already missed in the cache
+    """
+    voice_id = _VOICE_MAP.get(language, "lucy")
+    cache_key = _tts_cache_key(text, language)
+
+    try:
+        # Identical replies being voiced at the same time share one synthesis + upload
+        audio_url = _singleflight(cache_key, _synthesize_and_upload, text, language, voice_id)
+        if audio_url:
+            cache.set(cache_key, audio_url, TTS_CACHE_TTL)
+        return audio_url
 
     except Exception as e:
         logger.error("Spitch TTS failed: %s", e)
@@ -273,64 +550,81 @@ def safe_stt(audio_bytes, language):
         logger.error("Spitch STT failed: %s", e)
         return None
 
-def safe_gemini_conversational_audio_or_text(audio_bytes=None, input_format=None, text_input=None):
+def _conversational_cache_key(text_input):
+    # Long or personal prompts are never cached
+    if len(text_input) > GEMINI_CACHEABLE_MAX_CHARS or _PERSONAL_TOKENS.search(text_input):
+        return None
+    return _gemini_cache_key("gemini-chat", "auto", text_input)
+
+def cached_conversational_reply(text_input, metric="gemini_chat"):
+    """
+    (reply, lang) Gemini already gave for this text message, or None
+    """
+    cache_key = _conversational_cache_key(text_input)
+    if not cache_key:
+        return None
+    return record_cache_lookup(metric, cache.get(cache_key))
+
+def safe_gemini_conversational_audio_or_text(audio_bytes=None, input_format=None, text_input=None, normalized=False):
     if not GEMINI_API_KEY or not genai:
         logger.error("Gemini is not configured or its library is not installed.")
-        return "I'm sorry, Gemini is not available.", "en"
+        return GEMINI_UNAVAILABLE_REPLY, "en"
     
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        model = _gemini_model('gemini-2.0-flash')
         prompt_parts = []
-        
-        base_instructions = (
-            "Please analyze the provided input. First, identify the language used. "
-            "Then, respond naturally and conversationally to the content in the *exact same language* you detected. "
-            "Finally, append a language code at the very end of your response, formatted as 'Language Code: [code]'. "
-            "Use these specific codes: 'yo' for Yoruba, 'ig' for Igbo, 'ha' for Hausa, 'en' for English. "
-            "If the language is not Yoruba, Igbo, Hausa, or English, default the language code to 'en'. "
-            "Your conversational response should precede the language code. "
-            "You're a friendly multilingual Health, Education, Finance and Entertainment and AI assistant generally named VoiceBridge who explains things clearly, simply, and respectfully. "
-            "Always answer like you're speaking directly to the person, not writing a formal essay. Don't try to format text in anyway (use of double asterisk before and after words to make them bold, em dashes), just return plain text"
-        )
+        cache_key = None
 
         if text_input:
-            logger.info("Processing text input with Gemini 2.0 Flash.")
+            # Repeat text messages reuse the earlier (reply, language) pair
+            cache_key = _conversational_cache_key(text_input)
+            cached_reply = cached_conversational_reply(text_input)
+            if cached_reply:
+                return cached_reply
+
+            logger.debug("Processing text input with Gemini 2.0 Flash.")
             prompt_parts.append(text_input)
-            prompt_parts.append(base_instructions)
+            prompt_parts.append(_CONVERSATIONAL_INSTRUCTIONS)
         elif audio_bytes:
-            logger.info("Processing audio input with Gemini 2.0 Flash.")
-            usable_audio_wav = normalize_audio(audio_bytes, input_format=input_format)
-            if not usable_audio_wav:
+            logger.debug("Processing audio input with Gemini 2.0 Flash.")
+            # Callers that already produced 16 kHz mono WAV/FLAC skip a second decode;
+            # anything else is normalised to FLAC, the smallest lossless upload
+            if normalized:
+                usable_audio, audio_format = audio_bytes, input_format
+            else:
+                usable_audio = normalize_audio(audio_bytes, input_format=input_format, output_format="flac")
+                audio_format = "flac"
+            if not usable_audio:
                 logger.error("Audio normalization failed using existing normalize_audio function.")
                 return None, "en"
 
             audio_file = {
-                "mime_type": "audio/wav",
-                "data": usable_audio_wav
+                "mime_type": _AUDIO_MIME_TYPES[audio_format],
+                "data": usable_audio
             }
             prompt_parts.append(audio_file)
-            prompt_parts.append(base_instructions)
+            prompt_parts.append(_CONVERSATIONAL_INSTRUCTIONS)
         else:
             logger.error("No audio bytes or text input provided to safe_gemini_conversational_audio_or_text.")
             return None, "en"
 
-        response = model.generate_content(prompt_parts)
-        full_gemini_response = response.text.strip()
-        logger.info(f"Gemini raw response: {full_gemini_response}")
+        if cache_key:
+            # Identical text messages arriving together share one Gemini call
+            full_gemini_response = _singleflight(cache_key, _generate_text, model, prompt_parts).strip()
+        else:
+            full_gemini_response = _generate_text(model, prompt_parts).strip()
+        logger.debug("Gemini raw response: %s", full_gemini_response)
 
-        lang_code_prefix = "Language Code:"
         conversational_response = None
         detected_lang = "en" 
 
-        if lang_code_prefix in full_gemini_response:
-            parts = full_gemini_response.rsplit(lang_code_prefix, 1)
-            conversational_response = parts[0].strip()
-            code_raw = parts[1].strip().lower()
+        match = _LANG_CODE_TAIL.match(full_gemini_response)
+        if match:
+            conversational_response = match.group(1).strip()
+            code_raw = match.group(2).strip("[]'\". ").lower()
 
-            if code_raw in ["yo", "ig", "ha", "en"]:
+            if code_raw in _SUPPORTED_LANG_CODES:
                 detected_lang = code_raw
-            else:
-                detected_lang = "en"
         else:
             logger.warning("Gemini response did not contain the expected language code format. Defaulting to 'en'.")
             conversational_response = full_gemini_response
@@ -339,8 +633,13 @@ def safe_gemini_conversational_audio_or_text(audio_bytes=None, input_format=None
             logger.error("Gemini failed to provide a conversational response.")
             return None, "en"
 
+        if cache_key:
+            cache.set(cache_key, (conversational_response, detected_lang), GEMINI_CACHE_TTL)
         return conversational_response, detected_lang
 
+    except ResourceExhausted:
+        logger.warning("Gemini quota exhausted for conversational request.")
+        return GEMINI_OVERLOADED_REPLY, "en"
     except Exception as e:
         logger.error(f"safe_gemini_conversational_audio_or_text failed: {e}")
         return None, "en"
@@ -350,8 +649,6 @@ def send_whatsapp_audio(to_number, media_url, text="Here's your answer 🎧"):
         logger.error("Twilio credentials not set. Cannot send WhatsApp audio.")
         return None
     try:
-        twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-        
         # Ensure both numbers are in WhatsApp format
         from_whatsapp = TWILIO_WHATSAPP_NUMBER
         to_whatsapp = to_number
@@ -362,13 +659,16 @@ def send_whatsapp_audio(to_number, media_url, text="Here's your answer 🎧"):
         if not to_whatsapp.startswith('whatsapp:'):
             to_whatsapp = f'whatsapp:{to_whatsapp}'
         
-        message = twilio_client.messages.create(
-            from_=from_whatsapp,
-            to=to_whatsapp,
-            body=text,
-            media_url=[media_url]
-        )
-        logger.info(f"✅ WhatsApp audio sent: {message.sid}")
+        # text=None sends the audio without a caption
+        caption = {"body": text} if text else {}
+        with STAGE_LATENCY.labels("twilio_send").time():
+            message = TWILIO_CLIENT.messages.create(
+                from_=from_whatsapp,
+                to=to_whatsapp,
+                media_url=[media_url],
+                **caption
+            )
+        logger.debug("✅ WhatsApp audio sent: %s", message.sid)
         return message.sid
     except Exception as e:
         logger.error(f"Failed to send WhatsApp audio: {e}")
@@ -379,8 +679,6 @@ def send_whatsapp_message(to_number, text_message):
         logger.error("Twilio credentials not set. Cannot send WhatsApp message.")
         return None
     try:
-        twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-        
         # Ensure both numbers are in WhatsApp format
         from_whatsapp = TWILIO_WHATSAPP_NUMBER
         to_whatsapp = to_number
@@ -391,13 +689,132 @@ def send_whatsapp_message(to_number, text_message):
         if not to_whatsapp.startswith('whatsapp:'):
             to_whatsapp = f'whatsapp:{to_whatsapp}'
         
-        message = twilio_client.messages.create(
-            from_=from_whatsapp,
-            to=to_whatsapp,
-            body=text_message
-        )
-        logger.info(f"✅ WhatsApp text sent: {message.sid}")
+        with STAGE_LATENCY.labels("twilio_send").time():
+            message = TWILIO_CLIENT.messages.create(
+                from_=from_whatsapp,
+                to=to_whatsapp,
+                body=text_message
+            )
+        logger.debug("✅ WhatsApp text sent: %s", message.sid)
         return message.sid
     except Exception as e:
         logger.error(f"Failed to send WhatsApp text message: {e}")
-        return None
\ No newline at end of file
+        return None
+
+class MediaTooLargeError(Exception):
+    """
+    Raised when Twilio media is over MAX_WHATSAPP_AUDIO_BYTES; retrying won't help
+    """
+
+class MediaDownloadRetryableError(Exception):
+    """
+    Raised when a Twilio media download failed in a way a retry may fix:
+    timeouts, dropped connections, 429 and 5xx responses
+    """
+
+def download_twilio_media(media_url):
+    """
+    Download media from Twilio with proper authentication, as a bytearray.
+    Returns None for failures a retry won't fix (401/404, not audio, empty body)
+    """
+    try:
+        # Pooled session already carries the Twilio Basic Auth credentials.
+        # Streaming lets the headers be checked before any of the body is read.
+        with STAGE_LATENCY.labels("download").time(), \
+                TWILIO_SESSION.get(media_url, timeout=30, stream=True) as response:
+            response.raise_for_status()
+
+            content_type = response.headers.get("Content-Type", "")
+            if content_type and not content_type.startswith("audio/"):
+                logger.error(f"❌ Twilio media is not audio: {content_type}")
+                return None
+            expected = int(response.headers.get("Content-Length") or 0)
+            if expected > MAX_WHATSAPP_AUDIO_BYTES:
+                raise MediaTooLargeError(f"Twilio media too large: {expected} bytes")
+
+            # Fill a buffer sized from Content-Length so it never reallocates; it only
+            # grows when the header is missing, and the cap is enforced while reading.
+            # Decoding reads it in place (see _BufferReader), so it is never copied
+            audio_data = bytearray(expected)
+            received = 0
+            for chunk in response.iter_content(65536):
+                end = received + len(chunk)
+                if end > MAX_WHATSAPP_AUDIO_BYTES:
+                    raise MediaTooLargeError("Twilio media exceeded the size limit while downloading")
+                audio_data[received:end] = chunk
+                received = end
+            del audio_data[received:]
+
+        # Verify we actually got audio data
+        if len(audio_data) == 0:
+            logger.error("Downloaded audio file is empty")
+            return None
+
+        logger.debug("✅ Successfully downloaded media: %d bytes", len(audio_data))
+        return audio_data
+
+    except MediaTooLargeError:
+        raise
+    except requests.exceptions.HTTPError as e:
+        if e.response.status_code == 429 or e.response.status_code >= 500:
+            raise MediaDownloadRetryableError(f"Twilio media download failed: {e}") from e
+        if e.response.status_code == 401:
+            logger.error("❌ Authentication failed for Twilio media download. Check your Twilio credentials.")
+        elif e.response.status_code == 404:
+            logger.error("❌ Media file not found. It may have expired.")
+        else:
+            logger.error(f"❌ HTTP error downloading media: {e}")
+        return None
+    except (requests.exceptions.Timeout,
+            requests.exceptions.ConnectionError,
+            requests.exceptions.ChunkedEncodingError,
+            requests.exceptions.RetryError) as e:
+        # RetryError: the session's own 5xx retries ran out
+        raise MediaDownloadRetryableError(f"Twilio media download failed: {e}") from e
+    except Exception as e:
+        logger.error(f"❌ Unexpected error downloading media: {e}")
+        return None
+
+def send_whatsapp_reply(user_phone, ai_response, lang):
+    """
+    Reply to a WhatsApp user with the AI response as audio + text.
+    Cached audio goes out as one captioned message; otherwise the text is sent
+    first and the audio follows, uncaptioned, once TTS has rendered it.
+    """
+    try:
+        if not ai_response:
+            logger.warning("⚠️ AI response was empty — no message sent to WhatsApp")
+            send_whatsapp_message(user_phone, "I'm sorry, I couldn't generate a response at this time. Please try again.")
+            return
+
+        audio_reply_url = cached_tts_url(ai_response, lang)
+        if audio_reply_url:
+            # Send audio message with text as caption
+            message_sid = send_whatsapp_audio(
+                to_number=user_phone,
+                media_url=audio_reply_url,
+                text=ai_response  # This will be the text caption
+            )
+            logger.info("✅ WhatsApp audio+text response sent with SID: %s", message_sid)
+            return
+
+        # Deliver the text first; TTS runs on this worker thread afterwards, so
+        # synthesis concurrency stays bounded by the Celery pool
+        message_sid = send_whatsapp_message(
+            to_number=user_phone,
+            text_message=ai_response
+        )
+        logger.info("✅ WhatsApp text response sent with SID: %s", message_sid)
+
+        audio_reply_url = render_tts(ai_response, lang)
+        if audio_reply_url:
+            # The text is already in the chat, so the audio goes out uncaptioned
+            message_sid = send_whatsapp_audio(to_number=user_phone, media_url=audio_reply_url, text=None)
+            logger.info("✅ WhatsApp follow-up audio sent with SID: %s", message_sid)
+        else:
+            # The text already went out, so the user still has the answer
+            logger.warning("⚠️ TTS failed — text-only response sent")
+
+    except Exception as e:
+        logger.error("❌ WhatsApp response sending failed: %s", str(e))
+        send_whatsapp_message(user_phone, "An unexpected error occurred while trying to send my response. Please try again later.")
@@ -1,48 +1,56 @@
-import os
-import io
+import time
 import logging
-import requests # Still needed for IVR to fetch recording
+import hashlib
+from xml.sax.saxutils import escape
+from concurrent.futures import ThreadPoolExecutor
 
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db.models import Q
+from django.core.cache import cache
 from rest_framework import generics, status, views
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination
 from rest_framework.decorators import api_view
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.http import HttpResponse, JsonResponse
 from django.views import View
 from twilio.twiml.messaging_response import MessagingResponse
 
-TWILIO_ACCOUNT_SID = os.getenv("TWILIO_SID")
-TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
-TWILIO_WHATSAPP_NUMBER = os.getenv("TWILIO_WHATSAPP_NUMBER")
-
-from .models import UserProfile, QueryHistory, LessonContent
+from .models import QueryHistory, LessonContent
 from .serializers import (
     UserSerializer,
     UserProfileSerializer,
     QueryHistorySerializer,
     LessonContentSerializer,
+    LessonContentListSerializer,
     CustomTokenObtainPairSerializer
 )
 from .utils import ( 
     upload_to_cloudinary,
+    fetch_twilio_audio,
     ask_gemini,
-    normalize_audio,
     safe_tts,
     safe_stt,
     safe_gemini_conversational_audio_or_text,
-    send_whatsapp_audio,
-    send_whatsapp_message 
+    cached_conversational_reply,
+    cached_tts_url
 )
+from .tasks import process_whatsapp_message
+from .history import log_query
+from .signals import LESSONS_VERSION_KEY
 
 
 logger = logging.getLogger(__name__)
 
+# Shared pool for overlapping independent outbound calls (Cloudinary, Spitch, Gemini)
+EXECUTOR = ThreadPoolExecutor(max_workers=16)
+
 @api_view(['GET'])
 def home(request):
     return Response({"message": "VoiceBridge BackEnd Active."}, status=status.HTTP_200_OK)
@@ -77,24 +85,50 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UserProfileSerializer
     def get_object(self):
-        return UserProfile.objects.get(user=self.request.user)
+        # Loaded alongside the user by ProfileJWTAuthentication
+        return self.request.user.userprofile
 
 # === LOGS ===
+class QueryHistoryPagination(CursorPagination):
+    page_size = 20
+    ordering = '-timestamp'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
 class QueryHistoryList(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = QueryHistorySerializer
+    pagination_class = QueryHistoryPagination
     def get_queryset(self):
-        return QueryHistory.objects.filter(user=self.request.user)
+        # Matches the (user, -timestamp) index end to end
+        return QueryHistory.objects.only(
+            'id', 'query', 'response', 'category', 'language', 'timestamp', 'user_id'
+        ).filter(user=self.request.user).order_by('-timestamp')
 
 # === LESSONS ===
-class LessonPagination(PageNumberPagination):
+class LessonPagination(CursorPagination):
     page_size = 6
+    ordering = '-created_at'
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+# The lessons version is bumped by a signal in whichever process saved the lesson;
+# with per-process LocMem the other workers never see it, so no ETags are issued
+_SHARED_CACHE = not settings.CACHES["default"]["BACKEND"].endswith("LocMemCache")
+
+def lesson_list_etag(request, *args, **kwargs):
+    # Changes when lessons are added, removed or edited, or the page/filters/format change
+    if not _SHARED_CACHE:
+        return None
+    # A version lost from the cache is replaced by a fresh one, never by an old value
+    version = cache.get_or_set(LESSONS_VERSION_KEY, time.time_ns, None)
+    raw = f"{version}|{request.META.get('QUERY_STRING', '')}|{request.META.get('HTTP_ACCEPT', '')}"
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+@method_decorator(condition(etag_func=lesson_list_etag), name='get')
 class LessonContentView(generics.ListAPIView):
     permission_classes = [AllowAny]
-    serializer_class = LessonContentSerializer
+    serializer_class = LessonContentListSerializer
     pagination_class = LessonPagination
 
     def get_queryset(self):
@@ -102,18 +136,23 @@ class LessonContentView(generics.ListAPIView):
         category = self.request.query_params.get("category")
         search_query = self.request.query_params.get("search")
 
-        qs = LessonContent.objects.all().order_by('-created_at')
+        # List cards don't show the body, so don't fetch or serialize it
+        qs = LessonContent.objects.only('id', 'title', 'category', 'language', 'created_at')
 
         if lang and lang != 'all':
             qs = qs.filter(language=lang)
         if category and category != 'all':
             qs = qs.filter(category=category)
         if search_query:
-            qs = qs.filter(title__icontains=search_query) | \
-                 qs.filter(body__icontains=search_query)
+            qs = qs.filter(Q(title__icontains=search_query) | Q(body__icontains=search_query))
 
         return qs
 
+class LessonContentDetailView(generics.RetrieveAPIView):
+    permission_classes = [AllowAny]
+    serializer_class = LessonContentSerializer
+    queryset = LessonContent.objects.all()
+
 # === TEXT ASSISTANT ===
 class AssistantQueryView(views.APIView):
     permission_classes = [IsAuthenticated]
@@ -126,15 +165,10 @@ class AssistantQueryView(views.APIView):
             return Response({"error": "Missing query text"}, status=400)
 
         ai_response = ask_gemini(query, language)
-        audio_url = safe_tts(ai_response, language, "assistant")
+        audio_url = safe_tts(ai_response, language)
 
-        QueryHistory.objects.create(
-            user=request.user,
-            query=query,
-            response=ai_response,
-            category=category,
-            language=language,
-        )
+        # Buffered and bulk-inserted off the response path
+        log_query(request.user.id, query, ai_response, category, language)
 
         return Response({
             "query": query,
@@ -151,15 +185,25 @@ class VoiceUploadView(views.APIView):
         if not audio:
             return Response({"error": "No audio provided"}, status=400)
 
-        audio_bytes = audio.read()
+        # Archive the input audio while STT, Gemini and TTS run; none of them depend on it.
+        # Large uploads are already spooled to disk, so Cloudinary streams from that file
+        # on its own handle; small ones stream from Django's in-memory UploadedFile.
+        if hasattr(audio, "temporary_file_path"):
+            upload_future = EXECUTOR.submit(upload_to_cloudinary, audio.temporary_file_path())
+            audio_bytes = audio.read()
+        else:
+            audio_bytes = audio.read()
+            audio.seek(0)
+            upload_future = EXECUTOR.submit(upload_to_cloudinary, audio)
+
         transcription = safe_stt(audio_bytes, language)
         if not transcription:
+            upload_future.cancel()
             return Response({"error": "STT failed"}, status=500)
 
         ai_response = ask_gemini(transcription, language)
-        audio_url = safe_tts(ai_response, language, "voice")
-        # Ensure upload_to_cloudinary can handle BytesIO object or file path
-        uploaded_audio_url = upload_to_cloudinary(io.BytesIO(audio_bytes)) 
+        audio_url = safe_tts(ai_response, language)
+        uploaded_audio_url = upload_future.result()
 
         return Response({
             "query": transcription,
@@ -169,128 +213,84 @@ class VoiceUploadView(views.APIView):
         })
 
 # === IVR ===
+# Static TwiML is built once at import instead of on every call
+TWIML_GREETING = (
+    b'<Response>'
+    b'<Say voice="alice">Welcome to VoiceBridge. Please speak your message after the beep. '
+    b'Press any key or wait for the beep and start talking.</Say>'
+    b'<Record action="/api/assistant/ivr-hook" method="POST" maxLength="30" '
+    b'finishOnKey="#" playBeep="true" timeout="10"/>'
+    b'<Say voice="alice">We didn\'t hear anything. Goodbye.</Say>'
+    b'</Response>'
+)
+TWIML_VOICE_UNPROCESSABLE = b'<Response><Say voice="alice">Sorry, we couldn\'t process your voice. Please try again.</Say></Response>'
+TWIML_VOICE_UNREACHABLE = b'<Response><Say voice="alice">Sorry, we couldn\'t access your voice. Please try again.</Say></Response>'
+TWIML_NOT_UNDERSTOOD = b'<Response><Say voice="alice">Sorry, I didn\'t understand that. Please try speaking more clearly.</Say></Response>'
+TWIML_ERROR = b'<Response><Say voice="alice">Sorry, something went wrong. Please try again later.</Say></Response>'
+
 @method_decorator(csrf_exempt, name='dispatch')
 class IVRHookView(View):
     def post(self, request):
         try:
-            logger.info("📞 IVR webhook called")
-            
             # Log all incoming parameters for debugging
-            logger.info(f"IVR POST data: {dict(request.POST)}")
+            logger.debug("IVR POST data: %s", request.POST)
             
             recording_url = request.POST.get("RecordingUrl")
             call_sid = request.POST.get("CallSid")
             
-            logger.info(f"Call SID: {call_sid}, Recording URL: {recording_url}")
+            logger.debug("Call SID: %s, Recording URL: %s", call_sid, recording_url)
 
             if not recording_url:
                 # Initial call - provide greeting and record instructions
-                logger.info("Initial IVR call - sending greeting")
-                twiml = """
-                <Response>
-                    <Say voice="alice">Welcome to VoiceBridge. Please speak your message after the beep. Press any key or wait for the beep and start talking.</Say>
-                    <Record 
-                        action="/api/assistant/ivr-hook" 
-                        method="POST" 
-                        maxLength="30"
-                        finishOnKey="#"
-                        playBeep="true"
-                        timeout="10"
-                    />
-                    <Say voice="alice">We didn't hear anything. Goodbye.</Say>
-                </Response>
-                """
-                return HttpResponse(twiml, content_type="text/xml")
+                logger.debug("Initial IVR call - sending greeting")
+                return HttpResponse(TWIML_GREETING, content_type="text/xml")
 
             # Process the recording
-            logger.info("Processing IVR recording")
+            logger.debug("Processing IVR recording")
             
-            # Download recording with authentication (similar to WhatsApp)
+            # Stream the recording through ffmpeg as it downloads
             try:
-                audio_data = self.download_twilio_media(recording_url)
+                audio_data = fetch_twilio_audio(recording_url, output_format='flac')
                 if not audio_data:
                     logger.error("Failed to download IVR recording")
-                    return HttpResponse("""
-                        <Response>
-                            <Say voice="alice">Sorry, we couldn't process your voice. Please try again.</Say>
-                        </Response>
-                    """, content_type="text/xml")
+                    return HttpResponse(TWIML_VOICE_UNPROCESSABLE, content_type="text/xml")
             except Exception as download_error:
                 logger.error(f"IVR recording download failed: {download_error}")
-                return HttpResponse("""
-                    <Response>
-                        <Say voice="alice">Sorry, we couldn't access your voice. Please try again.</Say>
-                    </Response>
-                """, content_type="text/xml")
+                return HttpResponse(TWIML_VOICE_UNREACHABLE, content_type="text/xml")
 
             # Process with Gemini
-            logger.info("Sending audio to Gemini for processing")
-            ai_response, lang = safe_gemini_conversational_audio_or_text(audio_bytes=audio_data, input_format='wav')
+            logger.debug("Sending audio to Gemini for processing")
+            ai_response, lang = safe_gemini_conversational_audio_or_text(audio_bytes=audio_data, input_format='flac', normalized=True)
             
             if not ai_response:
                 logger.warning("Gemini failed to generate response for IVR.")
-                return HttpResponse("""
-                    <Response>
-                        <Say voice="alice">Sorry, I didn't understand that. Please try speaking more clearly.</Say>
-                    </Response>
-                """, content_type="text/xml")
+                return HttpResponse(TWIML_NOT_UNDERSTOOD, content_type="text/xml")
 
             # Generate TTS response
-            logger.info("Generating TTS response")
-            audio_url = safe_tts(ai_response, lang, "ivr")
+            logger.debug("Generating TTS response")
+            audio_url = safe_tts(ai_response, lang)
             
             if not audio_url:
                 logger.warning("TTS failed for IVR — falling back to text-to-speech")
-                # Fallback: use Twilio's Say instead of Play
-                twiml = f"""
-                <Response>
-                    <Say voice="alice">{ai_response[:500]}</Say>  <!-- Limit length for TTS -->
-                </Response>
-                """
+                # Fallback: use Twilio's Say instead of Play, length-limited and XML-escaped
+                twiml = f"<Response><Say voice=\"alice\">{escape(ai_response[:500])}</Say></Response>"
                 return HttpResponse(twiml, content_type="text/xml")
 
             # Success - play the generated audio
             logger.info("IVR processing successful - playing response")
-            twiml = f"""<Response><Play>{audio_url}</Play></Response>"""
+            twiml = f"<Response><Play>{escape(audio_url)}</Play></Response>"
             return HttpResponse(twiml, content_type="text/xml")
 
         except Exception as e:
             logger.error("❌ IVR processing failed: %s", str(e))
-            return HttpResponse("""
-                <Response>
-                    <Say voice="alice">Sorry, something went wrong. Please try again later.</Say>
-                </Response>
-            """, content_type="text/xml")
-
-    def download_twilio_media(self, media_url):
-        """
-        Reuse the same media download function from WhatsApp view
-        """
-        try:
-            auth = (TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-            
-            response = requests.get(
-                media_url,
-                auth=auth,
-                timeout=30,
-                stream=True
-            )
-            response.raise_for_status()
-            
-            audio_data = response.content
-            
-            if len(audio_data) == 0:
-                logger.error("Downloaded IVR recording is empty")
-                return None
-                
-            logger.info(f"✅ Successfully downloaded IVR recording: {len(audio_data)} bytes")
-            return audio_data
-            
-        except Exception as e:
-            logger.error(f"❌ IVR media download failed: {e}")
-            return None
+            return HttpResponse(TWIML_ERROR, content_type="text/xml")
 
 # === WHATSAPP ===
+# Twilio's limit for a message body returned in TwiML
+TWIML_MESSAGE_MAX_CHARS = 1600
+# What str(MessagingResponse()) renders, built once
+TWIML_EMPTY = b'<?xml version="1.0" encoding="UTF-8"?><Response />'
+
 @method_decorator(csrf_exempt, name='dispatch')
 class WhatsAppWebhookView(View):
     def post(self, request):
@@ -299,249 +299,21 @@ class WhatsAppWebhookView(View):
         body_text = request.POST.get("Body")
         user_phone = request.POST.get("From", "anonymous")
 
-        ai_response = None
-        lang = "en"
-        audio_reply_url = None
-
-        # Create TwiML response for acknowledgment
-        twiml_response = MessagingResponse()
-
-        if audio_url:
-            try:
-                logger.info(f"🎵 Processing WhatsApp audio from {audio_url}")
-                
-                # Download the audio file with Twilio authentication
-                try:
-                    audio_data = self.download_twilio_media(audio_url)
-                    if not audio_data:
-                        logger.error("❌ Failed to download audio with authentication")
-                        send_whatsapp_message(user_phone, "Sorry, I couldn't access your audio message. Can you try again?")
-                        return HttpResponse(str(twiml_response), content_type='text/xml')
-                    
-                    logger.info(f"✅ Downloaded audio file: {len(audio_data)} bytes")
-                except Exception as download_error:
-                    logger.error(f"❌ Failed to download audio: {download_error}")
-                    send_whatsapp_message(user_phone, "Sorry, I couldn't download your audio message. Can you try again?")
-                    return HttpResponse(str(twiml_response), content_type='text/xml')
-
-                # Enhanced audio processing for WhatsApp OGG format
-                processed_audio_data = self.process_whatsapp_audio(audio_data, 'ogg')
-                if not processed_audio_data:
-                    logger.error("❌ WhatsApp audio processing failed completely")
-                    send_whatsapp_message(user_phone, "I couldn't process your audio format. Could you try sending a text message instead?")
-                    return HttpResponse(str(twiml_response), content_type='text/xml')
-
-                # Try processing with Gemini
-                try:
-                    ai_response, lang = safe_gemini_conversational_audio_or_text(
-                        audio_bytes=processed_audio_data, 
-                        input_format='wav'
-                    )
-                except Exception as gemini_error:
-                    logger.error(f"❌ Gemini audio processing failed: {gemini_error}")
-                    # Fallback: try with original audio data as OGG
-                    try:
-                        logger.info("Trying fallback with original OGG data")
-                        ai_response, lang = safe_gemini_conversational_audio_or_text(
-                            audio_bytes=audio_data, 
-                            input_format='ogg'
-                        )
-                    except Exception as fallback_error:
-                        logger.error(f"❌ Fallback OGG processing also failed: {fallback_error}")
-                        send_whatsapp_message(user_phone, "I had trouble understanding your audio. Could you try sending a text message instead?")
-                        return HttpResponse(str(twiml_response), content_type='text/xml')
-
-                if not ai_response:
-                    logger.warning("Gemini returned empty response from WhatsApp audio.")
-                    send_whatsapp_message(user_phone, "I couldn't understand anything in your audio message. Could you try speaking more clearly or send a text?")
+        # A text message whose answer (and its audio) is already cached is answered
+        # inline in the TwiML, with no worker hop and no separate Twilio API call
+        if body_text and not audio_url:
+            cached_reply = cached_conversational_reply(body_text, metric="twiml_chat")
+            if cached_reply and len(cached_reply[0]) <= TWIML_MESSAGE_MAX_CHARS:
+                ai_response, lang = cached_reply
+                reply_audio_url = cached_tts_url(ai_response, lang, metric="twiml_tts")
+                if reply_audio_url:
+                    twiml_response = MessagingResponse()
+                    message = twiml_response.message()
+                    message.body(ai_response)
+                    message.media(reply_audio_url)
                     return HttpResponse(str(twiml_response), content_type='text/xml')
 
-            except Exception as e:
-                logger.error(f"❌ Complete WhatsApp audio processing failed: {str(e)}")
-                send_whatsapp_message(user_phone, "There was an unexpected error with your audio message. Please try a shorter message or use text.")
-                return HttpResponse(str(twiml_response), content_type='text/xml')
-
-        elif body_text:
-            ai_response, lang = safe_gemini_conversational_audio_or_text(text_input=body_text)
-            if not ai_response:
-                logger.warning("Gemini failed to generate response from WhatsApp text.")
-                send_whatsapp_message(user_phone, "Sorry, I couldn't understand your text message. Can you rephrase?")
-                return HttpResponse(str(twiml_response), content_type='text/xml')
-            
-        else:
-            logger.warning("WhatsApp webhook received no audio or text input.")
-            send_whatsapp_message(user_phone, "I didn't receive any message. Please send an audio or text message.")
-            return HttpResponse(str(twiml_response), content_type='text/xml')
-
-        try:
-            if ai_response:
-                # ALWAYS respond with audio + text, regardless of input type
-                audio_reply_url = safe_tts(ai_response, lang, "wa")
-
-                if audio_reply_url:
-                    # Send audio message with text as caption
-                    message_sid = send_whatsapp_audio(
-                        to_number=user_phone,
-                        media_url=audio_reply_url,
-                        text=ai_response  # This will be the text caption
-                    )
-                    send_whatsapp_message(
-                        to_number=user_phone,
-                        text_message=ai_response
-                    )
-                    logger.info("✅ WhatsApp audio+text response sent with SID: %s", message_sid)
-                else:
-                    # If TTS fails, fall back to text-only
-                    logger.warning("⚠️ TTS failed — sending text-only response")
-                    message_sid = send_whatsapp_message(
-                        to_number=user_phone,
-                        text_message=ai_response
-                    )
-                    logger.info("✅ WhatsApp text-only fallback sent with SID: %s", message_sid)
-            else:
-                logger.warning("⚠️ AI response was empty — no message sent to WhatsApp")
-                send_whatsapp_message(user_phone, "I'm sorry, I couldn't generate a response at this time. Please try again.")
-
-            # Return empty TwiML to acknowledge receipt
-            return HttpResponse(str(twiml_response), content_type='text/xml')
-            
-        except Exception as e:
-            logger.error("❌ WhatsApp response sending failed: %s", str(e))
-            send_whatsapp_message(user_phone, "An unexpected error occurred while trying to send my response. Please try again later.")
-            return HttpResponse(str(twiml_response), content_type='text/xml')
-
-    def download_twilio_media(self, media_url):
-        """
-        Download media from Twilio with proper authentication
-        """
-        try:
-            # Use your Twilio credentials for Basic Auth
-            auth = (TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-            
-            response = requests.get(
-                media_url,
-                auth=auth,
-                timeout=30,
-                stream=True
-            )
-            response.raise_for_status()
-            
-            # Get the content
-            audio_data = response.content
-            
-            # Verify we actually got audio data
-            if len(audio_data) == 0:
-                logger.error("Downloaded audio file is empty")
-                return None
-                
-            logger.info(f"✅ Successfully downloaded media: {len(audio_data)} bytes")
-            return audio_data
-            
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 401:
-                logger.error("❌ Authentication failed for Twilio media download. Check your Twilio credentials.")
-            elif e.response.status_code == 404:
-                logger.error("❌ Media file not found. It may have expired.")
-            else:
-                logger.error(f"❌ HTTP error downloading media: {e}")
-            return None
-        except requests.exceptions.Timeout:
-            logger.error("❌ Timeout downloading media from Twilio")
-            return None
-        except Exception as e:
-            logger.error(f"❌ Unexpected error downloading media: {e}")
-            return None
-
-    def process_whatsapp_audio(self, audio_bytes, input_format):
-        """
-        Specialized audio processing for WhatsApp OGG files
-        Uses FFmpeg directly for better compatibility
-        """
-        import tempfile
-        import os
-        import subprocess
-        
-        try:
-            # Create temporary files
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{input_format}') as input_file:
-                input_file.write(audio_bytes)
-                input_path = input_file.name
-            
-            output_path = input_path.replace(f'.{input_format}', '.wav')
-            ffmpeg_commands = [
-                [
-                    'ffmpeg', '-y', '-i', input_path,
-                    '-acodec', 'pcm_s16le', '-ac', '1', '-ar', '16000',
-                    '-f', 'wav', output_path
-                ],
-                [
-                    'ffmpeg', '-y', '-i', input_path,
-                    '-c:a', 'pcm_s16le', '-ac', '1', '-ar', '16000',
-                    output_path
-                ],
-                [
-                    'ffmpeg', '-y', '-i', input_path,
-                    output_path
-                ]
-            ]
-            
-            for i, cmd in enumerate(ffmpeg_commands):
-                try:
-                    logger.info(f"Trying FFmpeg command {i+1} for WhatsApp audio")
-                    result = subprocess.run(
-                        cmd, 
-                        capture_output=True, 
-                        text=True, 
-                        timeout=30
-                    )
-                    
-                    if result.returncode == 0:
-                        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                            with open(output_path, 'rb') as f:
-                                wav_data = f.read()
-                            
-                            logger.info(f"✅ WhatsApp audio processing successful with command {i+1}")
-                            
-                            # Clean up temporary files
-                            try:
-                                os.unlink(input_path)
-                                os.unlink(output_path)
-                            except:
-                                pass
-                                
-                            return wav_data
-                        else:
-                            logger.warning(f"Command {i+1} succeeded but output file is empty/missing")
-                    else:
-                        logger.warning(f"FFmpeg command {i+1} failed: {result.stderr}")
-                        
-                except subprocess.TimeoutExpired:
-                    logger.warning(f"FFmpeg command {i+1} timed out")
-                except Exception as cmd_error:
-                    logger.warning(f"FFmpeg command {i+1} error: {cmd_error}")
-            
-            logger.info("Falling back to original normalize_audio function")
-            fallback_result = normalize_audio(audio_bytes, input_format)
-            
-            # Clean up temporary files
-            try:
-                os.unlink(input_path)
-                if os.path.exists(output_path):
-                    os.unlink(output_path)
-            except:
-                pass
-                
-            return fallback_result
-                
-        except Exception as e:
-            logger.error(f"❌ WhatsApp audio processing completely failed: {str(e)}")
-            
-            try:
-                if 'input_path' in locals() and os.path.exists(input_path):
-                    os.unlink(input_path)
-                if 'output_path' in locals() and os.path.exists(output_path):
-                    os.unlink(output_path)
-            except:
-                pass
-                
-            return None
\ No newline at end of file
+        # Everything else runs in the worker; Twilio only needs the acknowledgment.
+        # Only plain strings go on the queue.
+        process_whatsapp_message.delay(user_phone, audio_url, body_text, media_type)
+        return HttpResponse(TWIML_EMPTY, content_type='text/xml')
@@ -0,0 +1,19 @@
+import os
+from celery import Celery
+from celery.signals import worker_ready
+from prometheus_client import start_http_server
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "voicebridge.settings")
+
+app = Celery("voicebridge")
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
+
+
+@worker_ready.connect
+def start_metrics_server(**kwargs):
+    # The WhatsApp pipeline runs here, not in the web process, so the worker
+    # serves its own Prometheus endpoint
+    port = os.getenv("CELERY_METRICS_PORT")
+    if port:
+        start_http_server(int(port))
@@ -36,7 +36,17 @@ CORS_ALLOW_ALL_ORIGINS = True
 # REST Framework Config
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "core.authentication.ProfileJWTAuthentication",
+    ),
+    # orjson (Rust-backed) for JSON bodies; form/multipart parsers stay for voice uploads
+    "DEFAULT_RENDERER_CLASSES": (
+        "drf_orjson_renderer.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "drf_orjson_renderer.parsers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
     ),
 }
 
@@ -87,12 +97,38 @@ TEMPLATES = [
 WSGI_APPLICATION = "voicebridge.wsgi.application"
 
 # Database (Supabase or any PostgreSQL backend)
+# Connections are kept open between requests and health-checked before reuse.
+# When fronted by PgBouncer in transaction mode, keep workers x threads within its pool.
 DATABASES = {
     "default": dj_database_url.config(
-        default=f"postgres://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+        default=f"postgres://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}",
+        conn_max_age=int(os.getenv("DB_CONN_MAX_AGE", "60")),
+        conn_health_checks=True,
     )
 }
 
+# Cache (shared Redis when REDIS_URL is set, per-process memory otherwise)
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Celery (background work such as history logging). Without a broker, tasks
+# run inline so local development doesn't need Redis.
+CELERY_BROKER_URL = REDIS_URL
+CELERY_TASK_ALWAYS_EAGER = not REDIS_URL
+CELERY_TASK_IGNORE_RESULT = True
+
 # Password Validators
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
@@ -107,6 +143,10 @@ TIME_ZONE = "UTC"
 USE_I18N = True
 USE_TZ = True
 
+# File Uploads
+# Voice uploads over 1 MB are spooled to a temp file instead of held in worker memory
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1_000_000
+
 # Static Files
 STATIC_URL = "static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"